@@ -0,0 +1,280 @@
+############
+#
+# Copyright (c) 2024-2026 Maxim Yudayev and KU Leuven eMedia Lab
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Created 2024-2025 for the KU Leuven AidWear, AidFOG, and RevalExo projects
+# by Maxim Yudayev [https://yudayev.com].
+#
+# ############
+
+from multiprocessing import Lock, shared_memory
+from multiprocessing.synchronize import Lock as _Lock, Semaphore
+from queue import Empty
+import struct
+from typing import Optional
+import numpy as np
+
+CACHE_LINE_SIZE = 64
+
+# per-frame header at the start of each slot: (timestamp, index, toa_s).
+FRAME_HEADER = struct.Struct("<dQd")
+
+
+def _align(num_bytes: int) -> int:
+    return -(-num_bytes // CACHE_LINE_SIZE) * CACHE_LINE_SIZE
+
+
+def _as_bytes(data) -> memoryview:
+    # strided buffers (e.g. subsampled planes) can't be cast to a flat byte view, compact them first.
+    view = memoryview(data)
+    if not view.c_contiguous:
+        view = memoryview(np.ascontiguousarray(data))
+    return view.cast("B")
+
+
+class SharedFrameBuffer:
+    """Pool of fixed-size frame slots in shared memory, for zero-copy handoff
+    of captured frames from a capture subprocess to the `Producer`.
+
+    Each slot holds a `FRAME_HEADER` followed by the frame payload, and has a busy flag:
+    the capture subprocess only writes into free slots and marks them busy,
+    the `Producer` reads the frame in place and releases the slot.
+    A full pool drops new frames instead of blocking the capture loop.
+    """
+
+    def __init__(
+        self,
+        num_slots: int,
+        slot_size: int,
+        shm_id: Optional[str] = None,
+    ):
+        """Constructor of the shared frame pool.
+
+        If `shm_id` is provided, will attach the instance to the specified underlying shared memory.
+
+        Args:
+            num_slots (int): Number of frames that can be in flight at once.
+            slot_size (int): Maximum number of bytes of a single frame.
+            shm_id (str, optional): Name of the shared memory to attach to. Defaults to `None`.
+        """
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self._flags_size = _align(num_slots)
+        self._slot_stride = _align(FRAME_HEADER.size + slot_size)
+
+        if shm_id is None:
+            self.shared_memory = shared_memory.SharedMemory(
+                create=True, size=self._flags_size + num_slots * self._slot_stride
+            )
+            self.shared_memory.buf[: self._flags_size] = bytes(self._flags_size)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=shm_id)
+
+        self._flags = self.shared_memory.buf[:num_slots]
+        self._slots = [
+            self.shared_memory.buf[offset : offset + FRAME_HEADER.size + slot_size]
+            for offset in range(self._flags_size, self._flags_size + num_slots * self._slot_stride, self._slot_stride)
+        ]
+        self._write_idx = 0
+
+    def get_info(self) -> dict:
+        """Gets the arguments to attach to the same shared memory from another process.
+
+        Returns:
+            dict: Keyword arguments of the constructor.
+        """
+        return {
+            "num_slots": self.num_slots,
+            "slot_size": self.slot_size,
+            "shm_id": self.shared_memory.name,
+        }
+
+    def write(self, data, timestamp: float, index: int, toa_s: float) -> tuple[int, int] | None:
+        """Copies the frame and its header into the next free slot and marks it busy.
+
+        Only to be used by the single capture subprocess owning this pool.
+
+        Args:
+            data (Buffer | None): Any object exposing a buffer (e.g. `frame.jpeg_buffer`, `np.ndarray`),
+                or `None` to only store the header.
+            timestamp (float): Time of sampling of the frame w.r.t. the camera clock.
+            index (int): Sequence number of the frame.
+            toa_s (float): Time of arrival of the frame w.r.t. system clock.
+
+        Returns:
+            tuple[int, int] | None: Slot index and number of payload bytes, or `None` if the frame was dropped.
+        """
+        slot = self._write_idx
+        if self._flags[slot]:
+            return None
+        buf = self._slots[slot]
+        if data is None:
+            num_bytes = 0
+        else:
+            view = _as_bytes(data)
+            num_bytes = view.nbytes
+            if num_bytes > self.slot_size:
+                return None
+            buf[FRAME_HEADER.size : FRAME_HEADER.size + num_bytes] = view
+        FRAME_HEADER.pack_into(buf, 0, timestamp, index, toa_s)
+        self._flags[slot] = 1
+        self._write_idx = (slot + 1) % self.num_slots
+        return slot, num_bytes
+
+    def read(self, slot: int, num_bytes: int) -> tuple[float, int, float, memoryview]:
+        """Unpacks the frame header and provides a view over the payload, valid until the slot is released.
+
+        Args:
+            slot (int): Index of the slot.
+            num_bytes (int): Number of payload bytes of the frame.
+
+        Returns:
+            tuple[float, int, float, memoryview]: Timestamp, index, toa and view over the payload bytes of the frame.
+        """
+        buf = self._slots[slot]
+        return (*FRAME_HEADER.unpack_from(buf, 0), buf[FRAME_HEADER.size : FRAME_HEADER.size + num_bytes])
+
+    def release(self, slot: int) -> None:
+        """Marks the slot free for the capture subprocess to reuse.
+
+        Args:
+            slot (int): Index of the slot.
+        """
+        self._flags[slot] = 0
+
+    def close(self) -> None:
+        self._flags.release()
+        for view in self._slots:
+            view.release()
+        self.shared_memory.close()
+
+    def unlink(self) -> None:
+        self.shared_memory.unlink()
+
+
+class SharedFrameQueue:
+    """Bounded single-producer single-consumer ring of frame metadata in shared memory.
+
+    Each record is a fixed-size struct `(slot, num_bytes)` pointing into the camera's `SharedFrameBuffer`.
+    The capture subprocess is the only writer of `tail` and the `Producer` the only writer of `head`,
+    so either side advances its own counter with a plain aligned 8-byte store, without CAS or pickling.
+    One ring per camera keeps every ring single-producer.
+    `head` and `tail` sit on separate cache lines, so a store to one does not invalidate the other side's line.
+
+    Python has no memory fences, so the counters are only touched under the ring's `fence` lock, never held for more
+    than a few loads and stores. Its release and acquire order the frame and record writes before the `tail` store
+    seen by the consumer, and the consumer's reads before the `head` store seen by the capture subprocess,
+    also on weakly ordered CPUs (e.g. aarch64) where plain stores may become visible out of order.
+
+    Every record is announced by releasing the `doorbell` semaphore, which can be shared by several rings,
+    so the consumer blocks on it until any ring has data instead of polling.
+    """
+
+    _record = struct.Struct("<HI")
+
+    def __init__(
+        self,
+        capacity: int,
+        doorbell: Semaphore,
+        fence: Optional[_Lock] = None,
+        shm_id: Optional[str] = None,
+    ):
+        """Constructor of the shared metadata ring.
+
+        If `shm_id` is provided, will attach the instance to the specified underlying shared memory.
+
+        Args:
+            capacity (int): Maximum number of frames waiting to be consumed.
+            doorbell (Semaphore): Semaphore released once per queued record.
+            fence (Lock, optional): Lock ordering the counters of the attached ring. Defaults to `None`.
+            shm_id (str, optional): Name of the shared memory to attach to. Defaults to `None`.
+        """
+        self.capacity = capacity
+        self.doorbell = doorbell
+        self.fence = Lock() if fence is None else fence
+        # `head` at offset 0, `tail` at offset 64, records from offset 128.
+        self._header_size = 2 * CACHE_LINE_SIZE
+
+        if shm_id is None:
+            size = self._header_size + capacity * self._record.size
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=size)
+            self.shared_memory.buf[:size] = bytes(size)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=shm_id)
+
+        self._buf = self.shared_memory.buf
+        self._head = self._buf[:8].cast("Q")
+        self._tail = self._buf[CACHE_LINE_SIZE : CACHE_LINE_SIZE + 8].cast("Q")
+        self._offsets = [self._header_size + i * self._record.size for i in range(capacity)]
+
+    def get_info(self) -> dict:
+        """Gets the arguments to attach to the same shared memory from another process.
+
+        Returns:
+            dict: Keyword arguments of the constructor.
+        """
+        return {
+            "capacity": self.capacity,
+            "doorbell": self.doorbell,
+            "fence": self.fence,
+            "shm_id": self.shared_memory.name,
+        }
+
+    def put(self, slot: int, num_bytes: int) -> bool:
+        """Appends the frame metadata, only to be called from the single capture subprocess.
+
+        Returns:
+            bool: Whether the record was queued, `False` if the ring is full.
+        """
+        tail = self._tail[0]
+        with self.fence:
+            if tail - self._head[0] >= self.capacity:
+                return False
+            self._record.pack_into(self._buf, self._offsets[tail % self.capacity], slot, num_bytes)
+            self._tail[0] = tail + 1
+        self.doorbell.release()
+        return True
+
+    def get_nowait(self) -> tuple[int, int]:
+        """Pops the oldest frame metadata, only to be called from the single consumer.
+
+        Raises:
+            Empty: If no record is ready.
+
+        Returns:
+            tuple[int, int]: Slot index and number of payload bytes of the frame.
+        """
+        head = self._head[0]
+        with self.fence:
+            if head == self._tail[0]:
+                raise Empty
+            msg = self._record.unpack_from(self._buf, self._offsets[head % self.capacity])
+            self._head[0] = head + 1
+        return msg
+
+    def close(self) -> None:
+        self._head.release()
+        self._tail.release()
+        self._buf.release()
+        self.shared_memory.close()
+
+    def unlink(self) -> None:
+        self.shared_memory.unlink()
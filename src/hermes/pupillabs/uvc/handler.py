@@ -25,15 +25,40 @@
 #
 # ############
 
+import os
+import sys
 import time
 from typing import Callable
 import uvc
-from multiprocessing import Queue
 from multiprocessing.synchronize import Event as _Event
 
 from hermes.utils.time_utils import get_time, init_time
 from hermes.utils.types import VideoFormatEnum
 
+from .frame_buffer import SharedFrameBuffer, SharedFrameQueue
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+# some UVC cameras pad MJPEG payloads past the end-of-image marker.
+JPEG_EOI_SEARCH_BYTES = 64
+# drops happen in bursts when the consumer falls behind, report them at most this often.
+DROP_REPORT_PERIOD_S = 1.0
+DROP_POOL_FULL = "shared frame pool is full or frame exceeds slot size"
+DROP_INCOMPLETE_JPEG = "incomplete JPEG"
+
+
+def is_complete_jpeg(buf) -> bool:
+    """Checks the start- and end-of-image markers of a JPEG frame, to catch truncated USB transfers.
+
+    Args:
+        buf (Buffer): Encoded JPEG frame.
+
+    Returns:
+        bool: Whether the frame starts with SOI and has EOI near its end.
+    """
+    view = memoryview(buf).cast("B")
+    return view[:2] == JPEG_SOI and JPEG_EOI in view[-JPEG_EOI_SEARCH_BYTES:].tobytes()
+
 
 class PupilUvcHandler:
     def __call__(
@@ -41,43 +66,61 @@ class PupilUvcHandler:
         ref_time_s: float,
         camera_name: str,
         camera_spec: dict,
-        queue: Queue[tuple[str, dict, float]],  # TODO: replace in favor of the upstream shared circular buffer
+        frame_queue_info: dict,
+        frame_buffer_info: dict,
         video_image_format: VideoFormatEnum,
+        is_validate_jpeg: bool,
+        cpu_idx: int | None,
         stop_event: _Event,
         keep_event: _Event,
         ready_event: _Event,
     ):
         init_time(ref_time_s)
+        # keep libusb transfer completions and frame copies on the same core's cache.
+        if cpu_idx is not None:
+            os.sched_setaffinity(0, {cpu_idx})
         self.camera_name = camera_name
         self.camera_spec = camera_spec
-        self.queue = queue
+        self.frame_queue = SharedFrameQueue(**frame_queue_info)
+        self.frame_buffer = SharedFrameBuffer(**frame_buffer_info)
         self.cap: uvc.Capture
+        self._cached_uid: str | None = None
+        self._num_dropped: dict[str, int] = {}
+        self._drop_report_time_s = time.monotonic()
 
+        # a camera that failed to open is retried by the capture loop on the missing `self.cap`.
         self._restart_cap_device()
 
-        if video_image_format == VideoFormatEnum.MJPEG:
-            get_buffer_fn = lambda frame: {"timestamp": frame.timestamp, "index": frame.index, "data": bytes(frame.jpeg_buffer)}
+        # pick the capture routine once, so the per-frame path reads the payload attribute directly.
+        if video_image_format == VideoFormatEnum.MJPEG and is_validate_jpeg:
+            get_frame_fn = self._get_valid_mjpeg_frame
+        elif video_image_format == VideoFormatEnum.MJPEG:
+            get_frame_fn = self._get_mjpeg_frame
         elif video_image_format == VideoFormatEnum.BGR:
-            get_buffer_fn = lambda frame: {"timestamp": frame.timestamp, "index": frame.index, "data": frame.bgr[None]}
+            get_frame_fn = self._get_bgr_frame
         elif video_image_format == VideoFormatEnum.YUV:
-            get_buffer_fn = lambda frame: {"timestamp": frame.timestamp, "index": frame.index, "data": frame.yuv[None]}
+            get_frame_fn = self._get_yuv_frame
         else:
-            get_buffer_fn = lambda frame: {"timestamp": frame.timestamp, "index": frame.index}
+            get_frame_fn = self._get_header_frame
 
-        # synchronize worker process to the upstream `keep_data` signal.
+        # synchronize worker process to the upstream `keep_data` signal,
+        #   blocking in the kernel but still exiting if stopped before recording started.
         ready_event.set()
-        keep_event.wait()
+        while not keep_event.wait(timeout=0.5):
+            if stop_event.is_set():
+                break
 
-        while not stop_event.is_set():
-            self._get_frame(get_buffer_fn)
-        self.cap.close()
+        self._capture_loop(get_frame_fn, stop_event)
+        self._report_drops()
+        if hasattr(self, "cap"):
+            self.cap.close()
+        self.frame_buffer.close()
+        self.frame_queue.close()
 
 
     def _restart_cap_device(self):
         try:
-            devices = dict(map(lambda dev: (dev["name"], dev["uid"]), uvc.device_list()))
-
-            self.cap = uvc.Capture(devices[self.camera_spec["name"]])
+            self.cap = self._open_cap_device()
             self.cap.bandwidth_factor = self.camera_spec["bandwidth_factor"]
 
             for mode in self.cap.available_modes:
@@ -94,24 +137,132 @@ class PupilUvcHandler:
             controls_by_name = {c.display_name: c for c in self.cap.controls}
             for ctrl_name, value in self.camera_spec.get("uvc_controls", {}).items():
                 ctrl = controls_by_name.get(ctrl_name)
+                if ctrl is None:
+                    print(f"Camera {self.camera_spec['name']} has no control '{ctrl_name}', skipping", flush=True)
+                    continue
                 try:
                     ctrl.value = value
                 except Exception as e:
-                    print(f"Could not set control for {self.camera_spec['name']} '{ctrl_name}' to {value}: {e}", file=True)
+                    print(f"Could not set control for {self.camera_spec['name']} '{ctrl_name}' to {value}: {e}", file=sys.stderr, flush=True)
+        except (KeyError, ValueError, uvc.InitError, uvc.OpenError) as e:
+            print(f"[PupilUvcProducer] Could not open '{self.camera_name}' camera, retrying: {e}", flush=True)
+            time.sleep(1)
+        # never let an unexpected error end the capture subprocess (or leave the `Producer` waiting on its `ready_event`),
+        #   back off and let the caller retry the same way.
         except Exception as e:
+            print(f"[PupilUvcProducer] Unexpected error opening '{self.camera_name}' camera, retrying: {e!r}", file=sys.stderr, flush=True)
             time.sleep(1)
 
 
-    def _get_frame(self, get_buffer_fn: Callable) -> None:
-        try:
-            frame = self.cap.get_frame(timeout=1)
-            toa_s = get_time()
-            out = get_buffer_fn(frame)
-            self.queue.put((self.camera_name, out, toa_s))
-        except uvc.InitError as err:
-            print(f"[PupilUvcProducer] Failed to init {self.camera_name}: {err}", flush=True)
-        except uvc.StreamError as err:
-            print(f"[PupilUvcProducer] Stream error for {self.camera_name}: {err}", flush=True)
-        except (TimeoutError, NameError, AttributeError) as err:
-            print(f"[PupilUvcProducer] Restarting lost connection to '{self.camera_name}' camera: {err}", flush=True)
-            self._restart_cap_device()
+    def _open_cap_device(self) -> uvc.Capture:
+        # release the stale capture first, or the device is still busy when reopened and its libusb handle leaks.
+        if hasattr(self, "cap"):
+            try:
+                self.cap.close()
+            except Exception:
+                pass
+            del self.cap
+
+        # reuse the UID of the last successful open, only enumerating the USB bus (slow, reads every descriptor) if that fails.
+        if self._cached_uid is not None:
+            try:
+                cap = uvc.Capture(self._cached_uid)
+                if cap.name == self.camera_spec["name"]:
+                    return cap
+                cap.close()
+            except (ValueError, uvc.OpenError, uvc.InitError):
+                pass
+            self._cached_uid = None
+
+        devices = dict(map(lambda dev: (dev["name"], dev["uid"]), uvc.device_list()))
+        cap = uvc.Capture(devices[self.camera_spec["name"]])
+        self._cached_uid = devices[self.camera_spec["name"]]
+        return cap
+
+
+    def _capture_loop(self, get_frame_fn: Callable[[], None], stop_event: _Event) -> None:
+        # the capture routine is already specialized per format at setup, the inner loop keeps the per-frame path
+        #   to that call and a locally bound stop check, leaving the outer loop only to recover from errors.
+        is_stopped = stop_event.is_set
+        while not is_stopped():
+            try:
+                while not is_stopped():
+                    get_frame_fn()
+            except uvc.InitError as err:
+                print(f"[PupilUvcProducer] Failed to init {self.camera_name}: {err}", flush=True)
+            except uvc.StreamError as err:
+                print(f"[PupilUvcProducer] Stream error for {self.camera_name}: {err}", flush=True)
+            except (TimeoutError, NameError, AttributeError) as err:
+                print(f"[PupilUvcProducer] Restarting lost connection to '{self.camera_name}' camera: {err}", flush=True)
+                self._restart_cap_device()
+            except Exception as err:
+                print(f"[PupilUvcProducer] Failed to capture frame of {self.camera_name}: {err!r}", file=sys.stderr, flush=True)
+
+
+    # frame payloads are written straight into the shared memory slots, without an intermediate `bytes` copy.
+    def _get_mjpeg_frame(self) -> None:
+        frame = self.cap.get_frame(timeout=1)
+        toa_s = get_time()
+        written = self.frame_buffer.write(frame.jpeg_buffer, frame.timestamp, frame.index, toa_s)
+        if written is None:
+            self._drop_frame(frame.index, DROP_POOL_FULL)
+        else:
+            self.frame_queue.put(*written)
+
+
+    def _get_valid_mjpeg_frame(self) -> None:
+        frame = self.cap.get_frame(timeout=1)
+        toa_s = get_time()
+        if not is_complete_jpeg(frame.jpeg_buffer):
+            self._drop_frame(frame.index, DROP_INCOMPLETE_JPEG)
+            return
+        written = self.frame_buffer.write(frame.jpeg_buffer, frame.timestamp, frame.index, toa_s)
+        if written is None:
+            self._drop_frame(frame.index, DROP_POOL_FULL)
+        else:
+            self.frame_queue.put(*written)
+
+
+    def _get_bgr_frame(self) -> None:
+        frame = self.cap.get_frame(timeout=1)
+        toa_s = get_time()
+        written = self.frame_buffer.write(frame.bgr, frame.timestamp, frame.index, toa_s)
+        if written is None:
+            self._drop_frame(frame.index, DROP_POOL_FULL)
+        else:
+            self.frame_queue.put(*written)
+
+
+    def _get_yuv_frame(self) -> None:
+        frame = self.cap.get_frame(timeout=1)
+        toa_s = get_time()
+        written = self.frame_buffer.write(frame.yuv, frame.timestamp, frame.index, toa_s)
+        if written is None:
+            self._drop_frame(frame.index, DROP_POOL_FULL)
+        else:
+            self.frame_queue.put(*written)
+
+
+    # formats without a payload only carry the frame header.
+    def _get_header_frame(self) -> None:
+        frame = self.cap.get_frame(timeout=1)
+        toa_s = get_time()
+        written = self.frame_buffer.write(None, frame.timestamp, frame.index, toa_s)
+        if written is None:
+            self._drop_frame(frame.index, DROP_POOL_FULL)
+        else:
+            self.frame_queue.put(*written)
+
+
+    def _drop_frame(self, index: int, reason: str) -> None:
+        self._num_dropped[reason] = self._num_dropped.get(reason, 0) + 1
+        if time.monotonic() - self._drop_report_time_s >= DROP_REPORT_PERIOD_S:
+            self._report_drops(index)
+
+
+    def _report_drops(self, index: int | None = None) -> None:
+        last = "" if index is None else f", last {index}"
+        for reason, num_dropped in self._num_dropped.items():
+            print(f"[PupilUvcProducer] Dropped {num_dropped} frames of {self.camera_name}{last}: {reason}", flush=True)
+        self._num_dropped.clear()
+        self._drop_report_time_s = time.monotonic()
@@ -25,9 +25,11 @@
 #
 # ############
 
-from multiprocessing import Process, Queue, Event
+from multiprocessing import Process, Event, Semaphore
 from multiprocessing.synchronize import Event as _Event
+import os
 from queue import Empty
+import time
 from typing import Optional
 import numpy as np
 
@@ -39,6 +41,7 @@ from hermes.utils.types import VideoFormatEnum, LoggingSpec
 from hermes.base.nodes.producer import Producer
 
 from .data_container import PupilUvcDataContainer
+from .frame_buffer import SharedFrameBuffer, SharedFrameQueue
 from .handler import PupilUvcHandler
 
 
@@ -55,16 +58,47 @@ class PupilUvcProducer(Producer):
         port_killsig: Optional[str] = PORT_KILL,
         transmit_delay_sample_period_s: Optional[float] = float("nan"),
         timesteps_before_solidified: Optional[int] = 0,
+        num_frame_slots: Optional[int] = 16,
+        is_pin_cpu: Optional[bool] = False,
+        is_validate_jpeg: Optional[bool] = False,
         **_,
     ):
         self._camera_mapping = camera_mapping
-        self._video_image_format = video_image_format
+        self._video_image_format = video_image_format if isinstance(video_image_format, VideoFormatEnum) else VideoFormatEnum[video_image_format]
+        self._num_frame_slots = num_frame_slots
+        self._is_validate_jpeg = is_validate_jpeg
+        self._is_pin_cpu = is_pin_cpu and hasattr(os, "sched_setaffinity")
+        if is_pin_cpu and not self._is_pin_cpu:
+            print("[PupilUvcProducer] CPU pinning is not supported on this platform, ignoring `is_pin_cpu`.", flush=True)
         self._is_continue_grabbing = True
-        self._start_index: dict[str, int | None] = dict(
-            map(lambda cam: (cam, None), self._camera_mapping.keys())
+        # sequence id of the first frame of each camera, -1 until it arrives.
+        self._start_index: dict[str, int] = dict(
+            map(lambda cam: (cam, -1), self._camera_mapping.keys())
         )
-        self._parse_frame_fn = self._parse_first_frame
-        self._cap_queue: Queue[tuple[str, dict, float]] = Queue()
+        # per-camera output bundles reused across frames, `_publish` copies them out synchronously.
+        self._outputs: dict[str, dict[str, np.ndarray]] = {
+            cam: {
+                "frame_timestamp": np.zeros((1, 1), dtype=np.uint64),
+                "frame_index": np.zeros((1, 1), dtype=np.uint64),
+                "frame_sequence_id": np.zeros((1, 1), dtype=np.uint64),
+                "toa_s": np.zeros((1, 1), dtype=np.float64),
+            }
+            for cam in self._camera_mapping.keys()
+        }
+        # in-place views of the shared memory slots, raw bytes for MJPEG and an image array otherwise.
+        if self._video_image_format == VideoFormatEnum.MJPEG:
+            self._convert_frame_fn = lambda camera_name, data: data
+        elif self._video_image_format in (VideoFormatEnum.BGR, VideoFormatEnum.YUV):
+            self._convert_frame_fn = lambda camera_name, data: np.frombuffer(data, dtype=np.uint8).reshape(self._frame_shapes[camera_name])
+        else:
+            self._convert_frame_fn = None
+        self._frame_queues: dict[str, SharedFrameQueue] = {}
+        self._poll_order: list[tuple[str, SharedFrameQueue]] = []
+        # counts frames queued by all cameras, each capture subprocess releases it once per frame.
+        self._frame_doorbell = Semaphore(0)
+        self._poll_idx = 0
+        self._frame_buffers: dict[str, SharedFrameBuffer] = {}
+        self._frame_shapes: dict[str, tuple[int, ...]] = {}
         self._cap_procs: list[Process] = []
         self._cap_handlers: list[PupilUvcHandler] = []
         self._stop_event = Event()
@@ -95,9 +129,20 @@ class PupilUvcProducer(Producer):
         return None
 
     def _connect(self) -> bool:
+        # dedicate a core to the consumer and one to each capture subprocess, wrapping around if there are too few.
+        cpus = sorted(os.sched_getaffinity(0)) if self._is_pin_cpu else []
+
         # launch each capture subprocess
         ready_events: list[_Event] = []
-        for cam in self._camera_mapping.keys():
+        for i, cam in enumerate(self._camera_mapping.keys()):
+            # preallocate shared memory slots large enough for a raw frame, which also bounds an MJPEG frame.
+            self._frame_shapes[cam] = (1, *self._camera_mapping[cam]["resolution"])
+            self._frame_buffers[cam] = SharedFrameBuffer(
+                num_slots=self._num_frame_slots,
+                slot_size=int(np.prod(self._camera_mapping[cam]["resolution"])),
+            )
+            # each slot is in flight at most once, so the ring never fills up before the pool does.
+            self._frame_queues[cam] = SharedFrameQueue(capacity=self._num_frame_slots, doorbell=self._frame_doorbell)
             handler = PupilUvcHandler()
             ready_event = Event()
             proc = Process(
@@ -107,8 +152,11 @@ class PupilUvcProducer(Producer):
                     self._ref_time_s,
                     cam,
                     self._camera_mapping[cam],
-                    self._cap_queue,
+                    self._frame_queues[cam].get_info(),
+                    self._frame_buffers[cam].get_info(),
                     self._video_image_format,
+                    self._is_validate_jpeg,
+                    cpus[(i + 1) % len(cpus)] if cpus else None,
                     self._stop_event,
                     self._keep_event,
                     ready_event,
@@ -119,6 +167,10 @@ class PupilUvcProducer(Producer):
             ready_events.append(ready_event)
             proc.start()
 
+        self._poll_order = list(self._frame_queues.items())
+        if cpus:
+            os.sched_setaffinity(0, {cpus[0]})
+
         # read their pipe with confirmation that each connected to the camera
         for event in ready_events: event.wait()
         return True
@@ -128,42 +180,65 @@ class PupilUvcProducer(Producer):
 
     def _process_data(self) -> None:
         try:
-            msg: tuple[str, dict, float] = self._cap_queue.get(timeout=10)
+            msgs = [self._get_frame_msg(timeout_s=10)]
             process_time_s = get_time()
-            output = self._parse_frame_fn(msg)
+            # coalesce frames other cameras already have ready into the same publish,
+            #   at most one per camera because a raw bytes channel stores one frame per push.
+            for camera_name, frame_queue in self._poll_order:
+                if camera_name != msgs[0][0]:
+                    try:
+                        msgs.append((camera_name, *frame_queue.get_nowait()))
+                    except Empty:
+                        pass
+            output = {}
+            for camera_name, slot, num_bytes in msgs:
+                frame = self._parse_frame(camera_name, *self._frame_buffers[camera_name].read(slot, num_bytes))
+                output[camera_name] = self._prep_output(*frame)
             tag: str = "%s.data" % self.topic
             self._publish(tag, process_time_s=process_time_s, data=output)
+            # frames are copied out of the shared memory slots by the time they are published and stored,
+            #   drop the reused bundles' views of the slots so the shared memory can be closed.
+            for camera_name, slot, _ in msgs:
+                self._outputs[camera_name].pop("frame", None)
+                self._frame_buffers[camera_name].release(slot)
         except Empty:
             if not self._is_continue_capture:
                 self._send_end_packet()
 
-    def _parse_first_frame(self, msg: tuple[str, dict, float]) -> dict[str, dict[str, np.ndarray]]:
-        camera_name, frame, toa_s = msg
-        if self._start_index[camera_name] is None:
-            self._start_index[camera_name] = frame["index"]
-            frame_index = 0
-        else:
-            frame_index = frame["index"] - self._start_index[camera_name]
-        if all(v is not None for v in self._start_index.values()):
-            self._parse_frame_fn = self._parse_frame
-        return self._prep_output(camera_name=camera_name, frame=frame, frame_index=frame_index, toa_s=toa_s)
-
-    def _parse_frame(self, msg: tuple[str, dict, float]) -> dict[str, dict[str, np.ndarray]]:
-        camera_name, frame, toa_s = msg
-        frame_index = frame["index"] - self._start_index[camera_name]
-        return self._prep_output(camera_name=camera_name, frame=frame, frame_index=frame_index, toa_s=toa_s)
-
-    def _prep_output(self, camera_name: str, frame: dict, frame_index: str, toa_s: float) -> dict[str, dict[str, np.ndarray]]:
-        output = {
-            camera_name: {
-                "frame_timestamp": np.array([[frame["timestamp"]]], dtype=np.uint64),
-                "frame_index": np.array([[frame_index]], dtype=np.uint64),
-                "frame_sequence_id": np.array([[frame["index"]]], dtype=np.uint64),
-                "toa_s": np.array([[toa_s]], dtype=np.float64),
-            }
-        }
-        if "data" in frame: 
-            output[camera_name]["frame"] = frame["data"]
+    def _get_frame_msg(self, timeout_s: float) -> tuple[str, int, int]:
+        # round-robin over cameras, blocking on the shared doorbell when every ring is empty.
+        #   Frames coalesced into a publish without taking their doorbell count leave surplus counts,
+        #   which only cost an extra scan of the rings.
+        num_cams = len(self._poll_order)
+        deadline_s = time.perf_counter() + timeout_s
+        while True:
+            for _ in range(num_cams):
+                self._poll_idx = (self._poll_idx + 1) % num_cams
+                camera_name, frame_queue = self._poll_order[self._poll_idx]
+                try:
+                    return (camera_name, *frame_queue.get_nowait())
+                except Empty:
+                    pass
+            remaining_s = deadline_s - time.perf_counter()
+            if remaining_s <= 0:
+                raise Empty
+            if not self._frame_doorbell.acquire(timeout=remaining_s):
+                raise Empty
+
+    def _parse_frame(self, camera_name: str, timestamp: float, index: int, toa_s: float, data: memoryview) -> tuple[str, float, int, int, float, memoryview]:
+        start_index = self._start_index[camera_name]
+        if start_index < 0:
+            start_index = self._start_index[camera_name] = index
+        return camera_name, timestamp, index - start_index, index, toa_s, data
+
+    def _prep_output(self, camera_name: str, timestamp: float, frame_index: int, index: int, toa_s: float, data: memoryview) -> dict[str, np.ndarray]:
+        output = self._outputs[camera_name]
+        output["frame_timestamp"][0, 0] = timestamp
+        output["frame_index"][0, 0] = frame_index
+        output["frame_sequence_id"][0, 0] = index
+        output["toa_s"][0, 0] = toa_s
+        if self._convert_frame_fn is not None:
+            output["frame"] = self._convert_frame_fn(camera_name, data)
         return output
 
     def _stop_new_data(self) -> None:
@@ -172,4 +247,12 @@ class PupilUvcProducer(Producer):
     def _cleanup(self) -> None:
         for proc in self._cap_procs:
             proc.join()
+        # unlink every shared memory segment even if closing one fails, to not leak them past the process.
+        for shared_frames in (*self._frame_queues.values(), *self._frame_buffers.values()):
+            try:
+                shared_frames.close()
+            except BufferError as err:
+                print(f"[PupilUvcProducer] Could not close shared memory '{shared_frames.shared_memory.name}': {err}", flush=True)
+            finally:
+                shared_frames.unlink()
         super()._cleanup()
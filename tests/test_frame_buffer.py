@@ -0,0 +1,126 @@
+############
+#
+# Copyright (c) 2024-2026 Maxim Yudayev and KU Leuven eMedia Lab
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Created 2024-2025 for the KU Leuven AidWear, AidFOG, and RevalExo projects
+# by Maxim Yudayev [https://yudayev.com].
+#
+# ############
+
+from multiprocessing import Semaphore
+from queue import Empty
+
+import numpy as np
+import pytest
+
+from hermes.pupillabs.uvc.frame_buffer import SharedFrameBuffer, SharedFrameQueue
+
+
+@pytest.fixture
+def frame_buffer():
+    frame_buffer = SharedFrameBuffer(num_slots=2, slot_size=16)
+    yield frame_buffer
+    try:
+        frame_buffer.close()
+    except BufferError:
+        pass
+    frame_buffer.unlink()
+
+
+@pytest.fixture
+def frame_queue():
+    frame_queue = SharedFrameQueue(capacity=4, doorbell=Semaphore(0))
+    yield frame_queue
+    frame_queue.close()
+    frame_queue.unlink()
+
+
+def test_buffer_roundtrip_across_attached_instance(frame_buffer):
+    writer = SharedFrameBuffer(**frame_buffer.get_info())
+    slot, num_bytes = writer.write(b"frame", 1.5, 7, 2.5)
+    timestamp, index, toa_s, data = frame_buffer.read(slot, num_bytes)
+    assert (timestamp, index, toa_s, bytes(data)) == (1.5, 7, 2.5, b"frame")
+    data.release()
+    writer.close()
+
+
+def test_buffer_drops_frames_while_slots_are_busy(frame_buffer):
+    assert frame_buffer.write(b"a", 0.0, 0, 0.0) == (0, 1)
+    assert frame_buffer.write(b"b", 0.0, 1, 0.0) == (1, 1)
+    assert frame_buffer.write(b"c", 0.0, 2, 0.0) is None
+    frame_buffer.release(0)
+    assert frame_buffer.write(b"c", 0.0, 2, 0.0) == (0, 1)
+
+
+def test_buffer_drops_oversize_frames(frame_buffer):
+    assert frame_buffer.write(bytes(17), 0.0, 0, 0.0) is None
+    assert frame_buffer.write(bytes(16), 0.0, 0, 0.0) == (0, 16)
+
+
+def test_buffer_writes_header_only_frames(frame_buffer):
+    slot, num_bytes = frame_buffer.write(None, 1.0, 3, 2.0)
+    timestamp, index, toa_s, data = frame_buffer.read(slot, num_bytes)
+    assert (timestamp, index, toa_s, data.nbytes) == (1.0, 3, 2.0, 0)
+    data.release()
+
+
+def test_buffer_compacts_strided_frames(frame_buffer):
+    frame = np.arange(16, dtype=np.uint8).reshape(4, 4)[::2]
+    slot, num_bytes = frame_buffer.write(frame, 0.0, 0, 0.0)
+    *_, data = frame_buffer.read(slot, num_bytes)
+    assert bytes(data) == frame.tobytes()
+    data.release()
+
+
+def test_buffer_close_fails_while_views_are_held(frame_buffer):
+    *_, data = frame_buffer.read(*frame_buffer.write(b"frame", 0.0, 0, 0.0))
+    frame = np.frombuffer(data, dtype=np.uint8)
+    with pytest.raises(BufferError):
+        frame_buffer.close()
+    del frame
+    data.release()
+    frame_buffer.close()
+
+
+def test_queue_is_fifo_and_wraps_around(frame_queue):
+    producer = SharedFrameQueue(**frame_queue.get_info())
+    for i in range(10):
+        assert producer.put(i, i * 10)
+        assert frame_queue.get_nowait() == (i, i * 10)
+    with pytest.raises(Empty):
+        frame_queue.get_nowait()
+    producer.close()
+
+
+def test_queue_rejects_records_when_full(frame_queue):
+    for i in range(4):
+        assert frame_queue.put(i, 0)
+    assert not frame_queue.put(4, 0)
+    assert frame_queue.get_nowait() == (0, 0)
+    assert frame_queue.put(4, 0)
+
+
+def test_queue_rings_doorbell_per_record(frame_queue):
+    frame_queue.put(0, 0)
+    frame_queue.put(1, 0)
+    assert frame_queue.doorbell.acquire(timeout=0.1)
+    assert frame_queue.doorbell.acquire(timeout=0.1)
+    assert not frame_queue.doorbell.acquire(timeout=0.01)
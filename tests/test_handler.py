@@ -0,0 +1,80 @@
+############
+#
+# Copyright (c) 2024-2026 Maxim Yudayev and KU Leuven eMedia Lab
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Created 2024-2025 for the KU Leuven AidWear, AidFOG, and RevalExo projects
+# by Maxim Yudayev [https://yudayev.com].
+#
+# ############
+
+from hermes.pupillabs.uvc import handler
+from hermes.pupillabs.uvc.handler import DROP_INCOMPLETE_JPEG, DROP_POOL_FULL, PupilUvcHandler, is_complete_jpeg
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+
+
+def test_complete_jpeg():
+    assert is_complete_jpeg(SOI + bytes(1000) + EOI)
+
+
+def test_complete_jpeg_with_padding_after_eoi():
+    assert is_complete_jpeg(SOI + bytes(1000) + EOI + bytes(32))
+
+
+def test_complete_jpeg_shorter_than_eoi_search():
+    assert is_complete_jpeg(SOI + bytes(8) + EOI)
+
+
+def test_truncated_jpeg():
+    assert not is_complete_jpeg(SOI + bytes(1000))
+    assert not is_complete_jpeg(SOI + bytes(8))
+
+
+def test_jpeg_without_soi():
+    assert not is_complete_jpeg(bytes(2) + bytes(1000) + EOI)
+
+
+def test_eoi_beyond_search_window():
+    assert not is_complete_jpeg(SOI + bytes(1000) + EOI + bytes(100))
+
+
+def test_drops_are_reported_once_per_period_by_reason(monkeypatch, capsys):
+    now_s = [0.0]
+    monkeypatch.setattr(handler.time, "monotonic", lambda: now_s[0])
+    cam_handler = PupilUvcHandler()
+    cam_handler.camera_name = "eye"
+    cam_handler._num_dropped = {}
+    cam_handler._drop_report_time_s = 0.0
+
+    for index in range(3):
+        cam_handler._drop_frame(index, DROP_POOL_FULL)
+    cam_handler._drop_frame(3, DROP_INCOMPLETE_JPEG)
+    assert capsys.readouterr().out == ""
+
+    now_s[0] = 1.0
+    cam_handler._drop_frame(4, DROP_INCOMPLETE_JPEG)
+    out = capsys.readouterr().out.splitlines()
+    assert out == [
+        f"[PupilUvcProducer] Dropped 3 frames of eye, last 4: {DROP_POOL_FULL}",
+        f"[PupilUvcProducer] Dropped 2 frames of eye, last 4: {DROP_INCOMPLETE_JPEG}",
+    ]
+    assert cam_handler._num_dropped == {}
@@ -0,0 +1,128 @@
+############
+#
+# Copyright (c) 2024-2026 Maxim Yudayev and KU Leuven eMedia Lab
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Created 2024-2025 for the KU Leuven AidWear, AidFOG, and RevalExo projects
+# by Maxim Yudayev [https://yudayev.com].
+#
+# ############
+
+from queue import Empty
+import threading
+
+import numpy as np
+import pytest
+
+from hermes.base.nodes.producer import Producer
+from hermes.utils.types import VideoFormatEnum
+
+from hermes.pupillabs.uvc.frame_buffer import SharedFrameBuffer, SharedFrameQueue
+from hermes.pupillabs.uvc.producer import PupilUvcProducer
+
+CAMERA_MAPPING = {
+    "left_eye": {"resolution": [2, 4, 1]},
+    "right_eye": {"resolution": [2, 4, 1]},
+}
+
+
+@pytest.fixture
+def producer(monkeypatch):
+    # skip the base `Producer` setup (sockets, `Storage` subprocess), only the frame handoff is under test.
+    monkeypatch.setattr(Producer, "__init__", lambda self, **_: None)
+    monkeypatch.setattr(PupilUvcProducer, "topic", "uvc")
+    producer = PupilUvcProducer(
+        topic="uvc",
+        host_ip="127.0.0.1",
+        camera_mapping=CAMERA_MAPPING,
+        logging_spec=None,
+        video_image_format=VideoFormatEnum.BGR,
+        num_frame_slots=4,
+    )
+    producer._is_continue_capture = True
+    producer.published = []
+    producer._publish = lambda tag, process_time_s, data: producer.published.append(
+        {cam: {key: np.array(value) for key, value in output.items()} for cam, output in data.items()}
+    )
+    for cam, spec in CAMERA_MAPPING.items():
+        producer._frame_shapes[cam] = (1, *spec["resolution"])
+        producer._frame_buffers[cam] = SharedFrameBuffer(num_slots=4, slot_size=int(np.prod(spec["resolution"])))
+        producer._frame_queues[cam] = SharedFrameQueue(capacity=4, doorbell=producer._frame_doorbell)
+    producer._poll_order = list(producer._frame_queues.items())
+    yield producer
+    for shared_frames in (*producer._frame_queues.values(), *producer._frame_buffers.values()):
+        shared_frames.close()
+        shared_frames.unlink()
+
+
+def capture(producer, camera_name, index, fill):
+    # same steps as the capture subprocess, on its own attached instances.
+    frame_buffer = SharedFrameBuffer(**producer._frame_buffers[camera_name].get_info())
+    frame_queue = SharedFrameQueue(**producer._frame_queues[camera_name].get_info())
+    frame_buffer._write_idx = index % frame_buffer.num_slots
+    slot, num_bytes = frame_buffer.write(np.full(8, fill, dtype=np.uint8), float(index), index, 0.0)
+    frame_queue.put(slot, num_bytes)
+    frame_buffer.close()
+    frame_queue.close()
+    return slot
+
+
+def test_parse_frame_counts_from_first_index_per_camera(producer):
+    assert producer._parse_frame("left_eye", 1.0, 100, 2.0, b"")[2] == 0
+    assert producer._parse_frame("left_eye", 1.0, 105, 2.0, b"")[2] == 5
+    assert producer._parse_frame("right_eye", 1.0, 7, 2.0, b"")[2] == 0
+
+
+def test_process_data_coalesces_one_frame_per_camera(producer):
+    left_slot = capture(producer, "left_eye", 0, 1)
+    capture(producer, "left_eye", 1, 2)
+    right_slot = capture(producer, "right_eye", 0, 3)
+
+    producer._process_data()
+    assert len(producer.published) == 1
+    output = producer.published[0]
+    assert set(output) == {"left_eye", "right_eye"}
+    assert output["left_eye"]["frame"].shape == (1, 2, 4, 1)
+    assert (output["left_eye"]["frame"] == 1).all()
+    assert (output["right_eye"]["frame"] == 3).all()
+    assert output["left_eye"]["frame_sequence_id"][0, 0] == 0
+
+    # published slots are released and no longer referenced by the reused bundles.
+    assert producer._frame_buffers["left_eye"]._flags[left_slot] == 0
+    assert producer._frame_buffers["right_eye"]._flags[right_slot] == 0
+    assert all("frame" not in output for output in producer._outputs.values())
+
+    producer._process_data()
+    assert set(producer.published[1]) == {"left_eye"}
+    assert (producer.published[1]["left_eye"]["frame"] == 2).all()
+    assert producer.published[1]["left_eye"]["frame_index"][0, 0] == 1
+
+
+def test_get_frame_msg_wakes_on_doorbell(producer):
+    timer = threading.Timer(0.1, capture, args=(producer, "right_eye", 0, 0))
+    timer.start()
+    camera_name, slot, num_bytes = producer._get_frame_msg(timeout_s=5)
+    timer.join()
+    assert (camera_name, num_bytes) == ("right_eye", 8)
+
+
+def test_get_frame_msg_times_out_without_frames(producer):
+    with pytest.raises(Empty):
+        producer._get_frame_msg(timeout_s=0.05)